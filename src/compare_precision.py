@@ -0,0 +1,63 @@
+import numpy as np
+import os
+import sys
+from generate_gaussian_field import generate_gaussian_field
+from galaxy_bias_expansion import galaxy_bias_field
+from field_power_spectrum import compute_power_spectrum
+
+# Runs generation, bias expansion, shifting and P(k) estimation once in float64
+# and once in float32 from the same random seed, and reports the per-bin
+# relative P(k) difference of the single-precision path.
+
+def relative_pk_difference(pk_64, pk_32):
+    return np.abs(pk_32 - pk_64) / np.abs(pk_64)
+
+def run_pipeline(pk_path, box_size, n_grid, b1, b2, bG2, n_bar, seed, dtype):
+    np.random.seed(seed)    # same realization for both precisions
+    delta = generate_gaussian_field(pk_path, box_size=box_size, n_grid=n_grid, dtype=dtype)
+    delta_h = galaxy_bias_field(delta, box_size, b1, b2, bG2, n_bar=n_bar)
+    return compute_power_spectrum(delta, box_size), compute_power_spectrum(delta_h, box_size)
+
+def main():
+    if len(sys.argv) < 2:
+        print("Usage: python src/compare_precision.py output/[model]/pk [n_grid]")
+        sys.exit(1)
+
+    folder = sys.argv[1]
+    if not os.path.isdir(folder):
+        print(f"Directory not found: {folder}")
+        sys.exit(1)
+
+    n_grid = int(sys.argv[2]) if len(sys.argv) > 2 else 128
+    box_size = 1000.0
+    b1, b2, bG2 = 1.2, -0.405, -0.127   # as in galaxy_bias_expansion.py
+    n_bar = 1e-3
+    seed = 42
+    tolerance = 1e-3    # maximum accepted per-bin relative difference
+
+    worst = 0.0
+    for filename in sorted(os.listdir(folder)):
+        if filename.endswith(".txt"):
+            pk_path = os.path.join(folder, filename)
+            print(f"Comparing float32 against float64 for: {filename}")
+
+            spectra_64 = run_pipeline(pk_path, box_size, n_grid, b1, b2, bG2, n_bar, seed, np.float64)
+            spectra_32 = run_pipeline(pk_path, box_size, n_grid, b1, b2, bG2, n_bar, seed, np.float32)
+
+            for label, (k_64, pk_64), (k_32, pk_32) in zip(("Gaussian", "Galaxy"), spectra_64, spectra_32):
+                if len(k_64) != len(k_32):
+                    print(f"  {label}: different number of valid bins ({len(k_64)} vs {len(k_32)})")
+                    worst = np.inf
+                    continue
+                rel_diff = relative_pk_difference(pk_64, pk_32)
+                print(f"  {label} field:")
+                for k, pk, diff in zip(k_64, pk_64, rel_diff):
+                    print(f"    k = {k:.5f} h/Mpc   P64(k) = {pk:.5e}   |ΔP/P| = {diff:.2e}")
+                worst = max(worst, rel_diff.max())
+
+    print(f"Maximum per-bin relative difference: {worst:.2e} (tolerance {tolerance:.0e})")
+    if worst > tolerance:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
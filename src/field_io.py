@@ -0,0 +1,136 @@
+import numpy as np
+import os
+import threading
+from collections import deque
+
+# Write-behind I/O shared by the pipeline scripts, so saving a field cube
+# overlaps with the FFT work on the next redshift.
+
+DEFAULT_N_GRID = 256    # production resolution; other grids get their own _n{N} directories
+
+def field_dir(model_dir, kind, n_grid):
+    # e.g. output/planck_lcdm/gaussian_field, or gaussian_field_n64 for a 64^3 preview
+    name = kind if n_grid == DEFAULT_N_GRID else f"{kind}_n{n_grid}"
+    return os.path.join(model_dir, name)
+
+def load_field(path):
+    # Fields are stored as .npy, or as .npz (key "field") when written with compress=True
+    if path.endswith(".npz"):
+        with np.load(path) as data:
+            return data["field"]
+    return np.load(path)
+
+def _fsync_dir(path):
+    # Make the rename itself durable (POSIX only)
+    if os.name == "posix":
+        fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+def _atomic_write(path, write, replaces=None):
+    # Write to a temporary file in the same directory, fsync, then rename over `path`;
+    # `replaces` (e.g. the .npy twin of an .npz) is removed once `path` is in place
+    tmp_path = f"{path}.tmp{os.getpid()}"
+    try:
+        with open(tmp_path, "wb") as f:
+            write(f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    if replaces is not None and os.path.exists(replaces):
+        os.remove(replaces)
+    _fsync_dir(path)
+
+class WriteBehindQueue:
+    """
+    Bounded write-behind queue backed by a background thread.
+    save_array takes ownership of a finished array and returns immediately; the
+    caller must not modify it afterwards. Files appear atomically
+    (temporary file, fsync, rename). Back-pressure: a submit blocks while max_items
+    writes, or more than max_bytes of array data, are still pending.
+    Use as a context manager; leaving the block waits for every write and re-raises
+    the first error from the writer thread.
+    """
+
+    def __init__(self, max_items=2, max_bytes=1 << 30, compress=False):
+        self.max_items = max_items
+        self.max_bytes = max_bytes
+        self.compress = compress
+        self._pending = deque()
+        self._pending_bytes = 0
+        self._error = None
+        self._closed = False
+        self._cond = threading.Condition()
+        self._thread = threading.Thread(target=self._run, name="write-behind", daemon=True)
+        self._thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+    def save_array(self, path, array):
+        # Returns the path actually written (.npz instead of .npy when compressing).
+        # A stale copy in the other format is removed, so readers see one file per field
+        base = os.path.splitext(path)[0]
+        if self.compress:
+            path, other = base + ".npz", base + ".npy"
+            write = lambda f: np.savez_compressed(f, field=array)
+        else:
+            path, other = base + ".npy", base + ".npz"
+            write = lambda f: np.save(f, array)
+        self._submit(path, write, array.nbytes, replaces=other)
+        return path
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join()
+        self._raise_error()
+
+    def _raise_error(self):
+        if self._error is not None:
+            error, self._error = self._error, None
+            raise error
+
+    def _submit(self, path, write, nbytes, replaces=None):
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("WriteBehindQueue is closed")
+            # Always admit one item, so a single array larger than max_bytes cannot deadlock
+            while self._pending and (len(self._pending) >= self.max_items
+                                     or self._pending_bytes + nbytes > self.max_bytes):
+                self._cond.wait()
+            self._raise_error()
+            self._pending.append((path, write, nbytes, replaces))
+            self._pending_bytes += nbytes
+            self._cond.notify_all()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._pending and not self._closed:
+                    self._cond.wait()
+                if not self._pending:
+                    return
+                path, write, nbytes, replaces = self._pending[0]  # stays counted until written
+            try:
+                _atomic_write(path, write, replaces)
+                print(f"Saved to: {path}")
+            except BaseException as e:
+                with self._cond:
+                    if self._error is None:
+                        self._error = e
+            with self._cond:
+                self._pending.popleft()
+                self._pending_bytes -= nbytes
+                self._cond.notify_all()
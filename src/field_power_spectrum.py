@@ -3,12 +3,12 @@ import os
 import sys
 import matplotlib.pyplot as plt
 from scipy.stats import binned_statistic
-from matplotlib import cm
+from field_io import load_field
 
 z_vals = ["0", "0.5", "1", "2", "3"]
-full_cmap = cm.get_cmap("OrRd")
+full_cmap = plt.get_cmap("OrRd")
 sliced_cmap = [full_cmap(i) for i in np.linspace(0.4, 1.0, len(z_vals))]
-colormap = cm.get_cmap("OrRd", len(z_vals)) 
+colormap = plt.get_cmap("OrRd", len(z_vals)) 
 z_colors = {z: sliced_cmap[i] for i, z in enumerate(z_vals)}
 
 
@@ -23,14 +23,14 @@ def extract_redshift(filename):
 
 def compute_power_spectrum(field, box_size):
     n_grid = field.shape[0] 
-    field_k = np.fft.fftn(field, norm="forward")    # real space to Fourier space: δ(k) 
+    field_k = np.fft.fftn(field, norm="forward")    # real space to Fourier space: δ(k); complex64 for a float32 field
     
     scaling =  (2 * np.pi) * (box_size ** 3)
     power = np.abs(field_k)**2  * scaling  # P(k) = |δ(k)|^2
 
     # k-grid
     kf = 2 * np.pi / box_size  #Fundamental mode
-    k = np.fft.fftfreq(n_grid, d=1.0 / n_grid) * kf
+    k = (np.fft.fftfreq(n_grid, d=1.0 / n_grid) * kf).astype(field.real.dtype)
     kx, ky, kz = np.meshgrid(k, k, k, indexing='ij')
     k_mag = np.sqrt(kx**2 + ky**2 + kz**2).flatten() #turn into 1D array
     power = power.flatten()
@@ -56,7 +56,7 @@ def compute_power_spectrum(field, box_size):
     k_bins = np.logspace(np.log10(k_min), np.log10(k_max), num=7)
 
 
-    # Bin power spectrum by |k| to get P(k)
+    # Bin power spectrum by |k| to get P(k); bin sums are accumulated in float64 by binned_statistic
     Pk, bin_edges, _ = binned_statistic(k_mag_nonzero, power_nonzero, bins=k_bins, statistic='mean')
     k_centers = 0.5 * (bin_edges[:-1] + bin_edges[1:])
     valid = (Pk > 0) & (~np.isnan(Pk))
@@ -75,8 +75,8 @@ def main():
 
     box_size = 500.0    #like in generate_gaussian_field.py
     files_with_z = []
-    for filename in os.listdir(input_dir):  #iterate over .npy files
-        if filename.endswith(".npy"):
+    for filename in os.listdir(input_dir):  #iterate over .npy/.npz files
+        if filename.endswith((".npy", ".npz")):
             z = extract_redshift(filename)
             if z is not None:
                 files_with_z.append((z, filename))
@@ -89,10 +89,10 @@ def main():
 
     plt.figure(figsize=(10, 6))
     for z, filename in files_with_z:
-        field = np.load(os.path.join(input_dir, filename))
+        field = load_field(os.path.join(input_dir, filename))
         
         # Print mean and variance for this redshift
-        print(f"z = {z:.2f}: Mean = {np.mean(field):.5f}, Variance = {np.var(field):.5f}")
+        print(f"z = {z:.2f}: Mean = {np.mean(field, dtype=np.float64):.5f}, Variance = {np.var(field, dtype=np.float64):.5f}")
 
         k_vals, pk_vals = compute_power_spectrum(field, box_size)
         z_part = z_vals[int(z)]
@@ -1,7 +1,9 @@
 import numpy as np
 import os
+import re
 import sys
 from scipy.interpolate import RegularGridInterpolator
+from field_io import WriteBehindQueue, load_field
 
 # Reference: Schmittfull et al. (2019)
 def extract_redshift(filename):
@@ -17,7 +19,7 @@ def compute_psi1(delta_k, box_size, n_grid):
     # Integrand of Eq (14): ψ1(k) = i k / k^2 δ1(k) 
 
     kf = 2 * np.pi / box_size
-    k = np.fft.fftfreq(n_grid, d=1.0 / n_grid) * kf
+    k = (np.fft.fftfreq(n_grid, d=1.0 / n_grid) * kf).astype(delta_k.real.dtype)  # keep single precision if δ(k) is complex64
     kx, ky, kz = np.meshgrid(k, k, k, indexing='ij')
     k_squared = kx**2 + ky**2 + kz**2
     k_squared[0, 0, 0] = 1  # avoid division by zero
@@ -32,19 +34,20 @@ def displace_field(field, psi1):
     Implements the shifted operator (Eq. 17)
     Õ(x) where x = q + ψ1(q) (Eq. 16)
     Uses cloud-in-cell (CIC) interpolation for higher accuracy.
+    The result has the dtype of `field` (float32 or float64).
     """
     n_grid = field.shape[0] # size of x axis (same as y and z)
     grid = np.arange(n_grid)
 
     interpolator = RegularGridInterpolator((grid, grid, grid), field, bounds_error=False, fill_value=0)
-    coords = np.indices((n_grid, n_grid, n_grid), dtype=float)  # shape (3, n, n, n)
+    coords = np.indices((n_grid, n_grid, n_grid), dtype=float)  # shape (3, n, n, n); positions stay float64 so small ψ1 survives q + ψ1
     displaced = coords + psi1  # shape (3, n, n, n)
     for i in range(3):
         displaced[i] = np.mod(displaced[i], n_grid)  # Periodic boundaries: mod(n) wraps around
 
     points = np.stack([displaced[0].ravel(), displaced[1].ravel(), displaced[2].ravel()], axis=-1)  # shape (n^3, 3)
     values = interpolator(points).reshape((n_grid, n_grid, n_grid)) #gives O(x) and reshapes to 3D grid
-    return values
+    return values.astype(field.dtype, copy=False)
 
 def galaxy_bias_field(delta, box_size, b1, b2, bG2, n_bar):
     """
@@ -54,6 +57,7 @@ def galaxy_bias_field(delta, box_size, b1, b2, bG2, n_bar):
     - G̃2(x): shifted version of the tidal operator
     - ε(x): shot noise
     Based on Equation (16)
+    Runs in the precision of `delta` (float32 -> complex64 FFTs); means are accumulated in float64.
     """
     n_grid = delta.shape[0]
 
@@ -66,11 +70,11 @@ def galaxy_bias_field(delta, box_size, b1, b2, bG2, n_bar):
 
     # Bias operators in Lagrangian space
     delta_squared = delta**2
-    delta_squared -= np.mean(delta_squared) # Eq. 8 and 9
+    delta_squared -= np.mean(delta_squared, dtype=np.float64) # Eq. 8 and 9
 
     # Tidal operator G2
     kf = 2 * np.pi / box_size   
-    k = np.fft.fftfreq(n_grid, d=1.0 / n_grid) * kf
+    k = (np.fft.fftfreq(n_grid, d=1.0 / n_grid) * kf).astype(delta.dtype)
     kx, ky, kz = np.meshgrid(k, k, k, indexing='ij')
     k_squared = kx**2 + ky**2 + kz**2
     k_squared[0, 0, 0] = 1
@@ -90,7 +94,7 @@ def galaxy_bias_field(delta, box_size, b1, b2, bG2, n_bar):
     trace_squared = laplacian_phi**2    # Second term of Eq. 10
     tidal_squared = sum(tidal_tensor[(i, j)]**2 for i in range(3) for j in range(3))   #First term of Eq. 10
     G2 = tidal_squared - trace_squared  # Eq. 10
-    G2 -= np.mean(G2)   # Theoretically, G2 has zero mean already at large scales (Footnote 3)
+    G2 -= np.mean(G2, dtype=np.float64)   # Theoretically, G2 has zero mean already at large scales (Footnote 3)
 
     # Shift fields from Lagrangian q to Eulerian x using ψ1
     delta_shifted = displace_field(delta, psi1)
@@ -105,49 +109,58 @@ def galaxy_bias_field(delta, box_size, b1, b2, bG2, n_bar):
         volume = box_size**3
         voxel_volume = volume / n_grid**3
         noise_std = np.sqrt(1 / (n_bar * voxel_volume))  # Gaussian std per voxel
-        epsilon = np.random.normal(loc=0.0, scale=noise_std, size=delta.shape)  # scale such that P(k) is 1/n_bar; 3d grid.
+        epsilon = np.random.normal(loc=0.0, scale=noise_std, size=delta.shape).astype(delta.dtype, copy=False)  # scale such that P(k) is 1/n_bar; 3d grid.
         delta_h += epsilon  # stochastic component
 
-    delta_h -= np.mean(delta_h)  # Remove mean to avoid bias
+    delta_h -= np.mean(delta_h, dtype=np.float64)  # Remove mean to avoid bias
     
     return delta_h
 
 def main():
+    usage = "Usage: python src/galaxy_bias_expansion.py output/[model]/gaussian_field [--float32] [--compress]"
     if len(sys.argv) < 2:
-        print("Usage: python src/galaxy_bias_expansion.py output/[model]/gaussian_field")
+        print(usage)
         sys.exit(1)
 
     input_dir = sys.argv[1]
+    flags = set(sys.argv[2:])
+    for arg in flags - {"--float32", "--compress"}:    # a typo would otherwise fall back to uncompressed float64
+        print(f"Unrecognised argument: {arg}")
+        print(usage)
+        sys.exit(1)
+    dtype = np.float32 if "--float32" in flags else np.float64
     if not os.path.isdir(input_dir):
         print(f"Directory not found: {input_dir}")
         sys.exit(1)
 
+    # Sibling galaxy_field/; a preview level gaussian_field_n64 maps to galaxy_field_n64
+    input_dir = os.path.normpath(input_dir)
     model_dir = os.path.dirname(input_dir)
-    output_dir = os.path.join(model_dir, "galaxy_field")
+    preview = re.search(r"_n\d+$", os.path.basename(input_dir))
+    output_dir = os.path.join(model_dir, "galaxy_field" + (preview.group() if preview else ""))
     os.makedirs(output_dir, exist_ok=True)
 
     box_size = 1000.0
     b1, b2, bG2 = 1.2, -0.405, -0.127   #b1 from DESI 2016 BSG Figure 3.4, scaling from Chen et al. (2019)
     n_bar = 1e-3  # DESI DR2 BGS number density Figure 3
 
-    for filename in sorted(os.listdir(input_dir)):
-        if filename.endswith(".npy"):
-            z = extract_redshift(filename)
-            if z is None:
-                continue
-
-            field_path = os.path.join(input_dir, filename)
-            delta = np.load(field_path)
+    with WriteBehindQueue(compress="--compress" in flags) as writer:
+        for filename in sorted(os.listdir(input_dir)):
+            if filename.endswith((".npy", ".npz")):
+                z = extract_redshift(filename)
+                if z is None:
+                    continue
 
-            print(f"Computing δ_h for z = {z} using shifted operators (Eq. 16)")
+                field_path = os.path.join(input_dir, filename)
+                delta = load_field(field_path).astype(dtype, copy=False)
 
-            delta_h = galaxy_bias_field(delta, box_size, b1, b2, bG2, n_bar=n_bar)
+                print(f"Computing δ_h for z = {z} using shifted operators (Eq. 16)")
 
-            base = os.path.splitext(filename)[0]
-            output_file = os.path.join(output_dir, f"{base}_galaxy.npy")
-            np.save(output_file, delta_h)
+                delta_h = galaxy_bias_field(delta, box_size, b1, b2, bG2, n_bar=n_bar)
 
-            print(f"Saved to {output_file}")
+                base = os.path.splitext(filename)[0]
+                output_file = os.path.join(output_dir, f"{base}_galaxy.npy")
+                writer.save_array(output_file, delta_h)  # written while the next redshift is computed
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -3,8 +3,50 @@ import numpy as np
 import os
 import sys
 from scipy.interpolate import interp1d
+from field_io import DEFAULT_N_GRID, WriteBehindQueue, field_dir
 
-def generate_gaussian_field(pk_file, box_size=1000.0, n_grid=256): #Box size in Mpc/h; 128^3 grid points
+def mode_rank(n_grid):
+    # Rank of each fftfreq index along one axis: 0, -1, 1, -2, 2, ... -> 0, 1, 2, 3, 4, ...
+    # The first n ranks are exactly the modes of an n-point grid, so grids nest as cubes [0, n)^3
+    freq = np.rint(np.fft.fftfreq(n_grid, d=1.0 / n_grid)).astype(int)
+    return np.where(freq >= 0, 2 * freq, -2 * freq - 1)
+
+def consistent_noise(n_grid, seed, dtype=np.float64):
+    """
+    Complex white noise on the k-grid (fftfreq order) in which mode (ix, iy, iz)
+    gets the same value for every power-of-two n_grid that contains it.
+    In rank space, shell L = [0, 2^L)^3 minus [0, 2^(L-1))^3 is drawn from its own
+    generator seeded by (seed, L), so a coarse grid never needs the fine one.
+    """
+    if n_grid < 1 or n_grid & (n_grid - 1):
+        raise ValueError(f"n_grid = {n_grid} must be a power of two for resolution-consistent fields")
+
+    noise_rank = np.empty((n_grid, n_grid, n_grid), dtype=np.result_type(dtype, np.complex64))
+    size, level = 1, 0
+    while size <= n_grid:
+        shell = np.ones((size, size, size), dtype=bool)
+        shell[:size // 2, :size // 2, :size // 2] = False
+        draws = np.random.default_rng([seed, level]).normal(0, 1, (np.count_nonzero(shell), 2))
+        noise_rank[:size, :size, :size][shell] = draws[:, 0] + 1j * draws[:, 1]  #δ(k) = A(k) + iB(k)
+        size, level = 2 * size, level + 1
+
+    rank = mode_rank(n_grid)
+    return noise_rank[np.ix_(rank, rank, rank)]
+
+def downsample_field(field, n_coarse):
+    # Exact band-limited downsample: keep modes with |i| < n_coarse / 2 on every axis and sample on the coarse grid
+    n_grid = field.shape[0]
+    field_k = np.fft.fftn(field, norm="forward")
+    freq = np.rint(np.fft.fftfreq(n_grid, d=1.0 / n_grid)).astype(int)
+    keep = np.flatnonzero(np.abs(freq) < n_coarse // 2)
+    coarse_index = freq[keep] % n_coarse
+    coarse_k = np.zeros((n_coarse, n_coarse, n_coarse), dtype=field_k.dtype)
+    coarse_k[np.ix_(coarse_index, coarse_index, coarse_index)] = field_k[np.ix_(keep, keep, keep)]
+    return np.fft.ifftn(coarse_k, norm="forward").real.astype(field.dtype, copy=False)
+
+def generate_gaussian_field(pk_file, box_size=1000.0, n_grid=256, dtype=np.float64, seed=None): #Box size in Mpc/h; 128^3 grid points; dtype=np.float32 for single precision
+    # With a seed, the field is resolution-consistent: generating at a smaller power-of-two
+    # n_grid gives exactly downsample_field of the larger one (Nyquist modes are left out)
     data = np.loadtxt(pk_file)  # Load P(k)
     k_vals, pk_vals = data[:, 0], data[:, 1]
     volume = box_size**3
@@ -15,54 +57,80 @@ def generate_gaussian_field(pk_file, box_size=1000.0, n_grid=256): #Box size in
     kf = 2 * np.pi / box_size   #fundamental mode (smallest k, longest wavelength)
 
     # FFT: transform from density at each point to Fourier space
-    grid = np.fft.fftfreq(n_grid, d=1.0 / n_grid) * kf  #1d array of Fourier mode indices; correct scaling with d=1.0
+    grid = (np.fft.fftfreq(n_grid, d=1.0 / n_grid) * kf).astype(dtype)  #1d array of Fourier mode indices; correct scaling with d=1.0
     kx, ky, kz = np.meshgrid(grid, grid, grid, indexing='ij')  #assign kx,ky,kz to each grid point
     k_mag = np.sqrt(kx**2 + ky**2 + kz**2)
 
     # Assuming Gaussian perturbations at early times
-    random_real = np.random.normal(0, 1, (n_grid, n_grid, n_grid))
-    random_imag = np.random.normal(0, 1, (n_grid, n_grid, n_grid))
-    noise = random_real + 1j * random_imag  #δ(k) = A(k) + iB(k)
+    # Drawn in float64 and cast, so both precisions share the same realization
+    if seed is None:
+        random_real = np.random.normal(0, 1, (n_grid, n_grid, n_grid)).astype(dtype, copy=False)
+        random_imag = np.random.normal(0, 1, (n_grid, n_grid, n_grid)).astype(dtype, copy=False)
+        noise = random_real + 1j * random_imag  #δ(k) = A(k) + iB(k)
+    else:
+        noise = consistent_noise(n_grid, seed, dtype)
 
     # Recall P(k) = ⟨∣δ(k)∣²⟩ = ⟨A²⟩ + ⟨B²⟩ = 2σ²
-    amplitude = np.sqrt(pk_interp(k_mag) / 2.0)
+    amplitude = np.sqrt(pk_interp(k_mag) / 2.0).astype(dtype, copy=False)
     field_k = noise * amplitude #correctly scaled noise
     
     field_k[0, 0, 0] = 0.0  # Set zero mode to 0 (remove biased background)
+    if seed is not None:
+        nyquist = n_grid // 2   # band-limit: the Nyquist plane is not a mode of the finer grids' coarse band
+        field_k[nyquist, :, :] = field_k[:, nyquist, :] = field_k[:, :, nyquist] = 0.0
     field_real = np.fft.ifftn(field_k, norm="forward").real # Inverse FFT to get real-space field
 
-    print("Field variance (real space):", np.var(field_real))
-    print("Field mean (real space):", np.mean(field_real))
+    print("Field variance (real space):", np.var(field_real, dtype=np.float64))   # accumulate in float64
+    print("Field mean (real space):", np.mean(field_real, dtype=np.float64))
     print("Typical P(k):", np.median(pk_interp(k_mag)))
 
     return field_real
 
 def main():
+    usage = "Usage: python src/generate_gaussian_field.py output/[model_folder] [--float32] [--seed=S] [--n_grid=N] [--compress]"
     if len(sys.argv) < 2:
-        print("Usage: python src/generate_gaussian_field.py output/[model_folder]")
+        print(usage)
         sys.exit(1)
 
     folder = sys.argv[1]
+    flags, options = set(), {}
+    for arg in sys.argv[2:]:
+        key, _, value = arg.partition("=")
+        if arg in ("--float32", "--compress"):
+            flags.add(arg)
+        elif key in ("--seed", "--n_grid") and value.isdigit():
+            options[key[2:]] = int(value)
+        else:   # e.g. "--seed 42" would otherwise silently produce a legacy 256^3 field
+            print(f"Unrecognised argument: {arg}")
+            print(usage)
+            sys.exit(1)
+    dtype = np.float32 if "--float32" in flags else np.float64
+    seed = options.get("seed")
+    n_grid = options.get("n_grid", DEFAULT_N_GRID)
+    if n_grid < 1 or (seed is not None and n_grid & (n_grid - 1)):
+        print(f"--n_grid must be a positive integer{' and a power of two with --seed' if seed is not None else ''}, got: {n_grid}")
+        print(usage)
+        sys.exit(1)
     if not os.path.isdir(folder):
         print(f"Directory not found: {folder}")
         sys.exit(1)
 
     # Define the output folder for Gaussian fields
     parent_folder = os.path.dirname(folder)
-    gaussian_field_dir = os.path.join(parent_folder, "gaussian_field")
+    gaussian_field_dir = field_dir(parent_folder, "gaussian_field", n_grid)  # previews do not overwrite production fields
     os.makedirs(gaussian_field_dir, exist_ok=True)
 
-    # Loop through .txt files inside the folder called
-    for filename in sorted(os.listdir(folder)):
-        if filename.endswith(".txt"):
-            pk_path = os.path.join(folder, filename)
-            base_name = os.path.splitext(filename)[0]
-            npy_path = os.path.join(gaussian_field_dir, f"{base_name}.npy")
-
-            print(f"Generating Gaussian field from: {filename}")
-            field = generate_gaussian_field(pk_path)
-            np.save(npy_path, field)
-            print(f"Saved field to: {npy_path}")
+    # Loop through .txt files inside the folder called; saves run in the background
+    with WriteBehindQueue(compress="--compress" in flags) as writer:
+        for filename in sorted(os.listdir(folder)):
+            if filename.endswith(".txt"):
+                pk_path = os.path.join(folder, filename)
+                base_name = os.path.splitext(filename)[0]
+                npy_path = os.path.join(gaussian_field_dir, f"{base_name}.npy")
+
+                print(f"Generating Gaussian field from: {filename}")
+                field = generate_gaussian_field(pk_path, n_grid=n_grid, dtype=dtype, seed=seed)
+                writer.save_array(npy_path, field)  # writer owns field from here on
 
 
 if __name__ == "__main__":
@@ -0,0 +1,335 @@
+import numpy as np
+import os
+import sys
+from mpi4py import MPI
+from scipy.interpolate import RegularGridInterpolator, interp1d
+from scipy.stats import binned_statistic
+from field_io import DEFAULT_N_GRID, field_dir
+
+# Domain-decomposed (MPI) versions of generate_gaussian_field, galaxy_bias_field
+# and compute_power_spectrum for grids that do not fit in a single process.
+# Real space: each rank owns n_grid / size planes along x, shape (n_local, n, n).
+# Fourier space: the data is transposed so that each rank owns n_grid / size
+# planes along ky, shape (n, n_local, n) with axes (kx, ky, kz).
+
+def slab_range(n_grid, comm):
+    size, rank = comm.Get_size(), comm.Get_rank()
+    if n_grid % size != 0:
+        raise ValueError(f"n_grid = {n_grid} is not divisible by the number of ranks ({size})")
+    n_local = n_grid // size
+    return rank * n_local, (rank + 1) * n_local
+
+def transpose_x_to_y(a, comm):
+    # (x local, y, z) -> (x, y local, z): rank j receives every rank's block of y-planes j
+    size = comm.Get_size()
+    n_local, n_grid, n_last = a.shape
+    send = np.ascontiguousarray(a.reshape(n_local, size, n_local, n_last).transpose(1, 0, 2, 3))
+    recv = np.empty_like(send)
+    comm.Alltoall(send, recv)
+    return recv.reshape(n_grid, n_local, n_last)
+
+def transpose_y_to_x(a, comm):
+    # (x, y local, z) -> (x local, y, z): inverse of transpose_x_to_y
+    size = comm.Get_size()
+    n_grid, n_local, n_last = a.shape
+    send = np.ascontiguousarray(a).reshape(size, n_local, n_local, n_last)
+    recv = np.empty_like(send)
+    comm.Alltoall(send, recv)
+    return recv.transpose(1, 0, 2, 3).reshape(n_local, n_grid, n_last)
+
+def forward_fft(a, comm, norm="backward"):
+    # Same as np.fft.fftn(a, norm=norm) on the full grid, returned in the (kx, ky local, kz) layout
+    a_k = np.fft.fftn(a, axes=(1, 2), norm=norm)
+    a_k = transpose_x_to_y(a_k, comm)
+    return np.fft.fft(a_k, axis=0, norm=norm)
+
+def inverse_fft(a_k, comm, norm="backward"):
+    # Same as np.fft.ifftn(a_k, norm=norm) on the full grid, returned as an x-slab
+    a = np.fft.ifft(a_k, axis=0, norm=norm)
+    a = transpose_y_to_x(a, comm)
+    return np.fft.ifftn(a, axes=(1, 2), norm=norm)
+
+def local_k_grid(n_grid, box_size, comm, dtype=np.float64):
+    # Sparse (broadcastable) kx, ky, kz for this rank's ky planes
+    y0, y1 = slab_range(n_grid, comm)
+    kf = 2 * np.pi / box_size
+    k = (np.fft.fftfreq(n_grid, d=1.0 / n_grid) * kf).astype(dtype)
+    return np.meshgrid(k, k[y0:y1], k, indexing='ij', sparse=True)
+
+def global_mean(a, comm):
+    return comm.allreduce(np.sum(a, dtype=np.float64)) / comm.allreduce(a.size)  # accumulate in float64
+
+def scatter_normal(scale, n_grid, comm, dtype=np.float64):
+    """
+    Draw N(0, scale) on the full n_grid^3 cube and hand each rank its x-slab.
+    Rank 0 draws one slab at a time in rank order, so with the same np.random
+    seed this reproduces np.random.normal(0, scale, (n, n, n)) of the serial code.
+    Slabs are cast to `dtype` before they are sent.
+    """
+    rank, size = comm.Get_rank(), comm.Get_size()
+    shape = (n_grid // size, n_grid, n_grid)
+    if rank == 0:
+        local = np.random.normal(0, scale, shape).astype(dtype, copy=False)
+        for dest in range(1, size):
+            comm.Send(np.random.normal(0, scale, shape).astype(dtype, copy=False), dest=dest)
+        return local
+    local = np.empty(shape, dtype=dtype)
+    comm.Recv(local, source=0)
+    return local
+
+def exchange_halo(field, width, comm):
+    """
+    Return this rank's slab padded with `width` periodic ghost planes on each side
+    along x, shape (n_local + 2 * width, n, n). Slabs are passed around the ring
+    until enough planes have arrived, so width may exceed n_local.
+    """
+    if width == 0:
+        return field
+    rank, size = comm.Get_rank(), comm.Get_size()
+    left, right = (rank - 1) % size, (rank + 1) % size
+    field = np.ascontiguousarray(field)
+    below, above = [], []
+    from_left = from_right = field
+    n_have = 0
+    while n_have < width:
+        recv = np.empty_like(field)
+        comm.Sendrecv(from_left, dest=right, recvbuf=recv, source=left)
+        below.insert(0, recv)
+        from_left = recv
+        recv = np.empty_like(field)
+        comm.Sendrecv(from_right, dest=left, recvbuf=recv, source=right)
+        above.append(recv)
+        from_right = recv
+        n_have += field.shape[0]
+    below = np.concatenate(below)[-width:]
+    above = np.concatenate(above)[:width]
+    return np.concatenate([below, field, above])
+
+def displace_field_mpi(field, psi1, comm):
+    """
+    Slab version of galaxy_bias_expansion.displace_field (Eq. 16-17).
+    Displaced points that leave the rank's slab along x are served from ghost
+    planes obtained with exchange_halo; y and z are local to every rank.
+    """
+    n_grid = field.shape[1]
+    x0, x1 = slab_range(n_grid, comm)
+
+    coords = np.indices(field.shape, dtype=float)  # shape (3, n_local, n, n); float64 positions in either precision
+    coords[0] += x0
+    displaced = coords + psi1
+
+    # CIC needs planes floor(x) and floor(x) + 1 along the unwrapped x axis
+    x_lo = np.floor(displaced[0].min())
+    x_hi = np.floor(displaced[0].max()) + 1
+    width = int(max(x0 - x_lo, x_hi - (x1 - 1), 0))
+    width = comm.allreduce(width, op=MPI.MAX)  # same number of exchange rounds on every rank
+    padded = exchange_halo(field, width, comm)
+
+    grid = np.arange(n_grid)
+    x_grid = np.arange(x0 - width, x1 + width)
+    interpolator = RegularGridInterpolator((x_grid, grid, grid), padded, bounds_error=False, fill_value=0)
+
+    wrapped_x = np.mod(displaced[0], n_grid)  # Periodic boundaries, as in the serial code
+    for i in (1, 2):
+        displaced[i] = np.mod(displaced[i], n_grid)
+
+    points = np.stack([displaced[0].ravel(), displaced[1].ravel(), displaced[2].ravel()], axis=-1)
+    values = interpolator(points)
+    # The serial interpolator treats wrapped x in (n - 1, n) as out of bounds
+    values[wrapped_x.ravel() > n_grid - 1] = 0
+    return values.reshape(field.shape).astype(field.dtype, copy=False)
+
+def generate_gaussian_field_mpi(pk_file, comm, box_size=1000.0, n_grid=256, dtype=np.float64):
+    # Slab version of generate_gaussian_field.generate_gaussian_field
+    data = np.loadtxt(pk_file)
+    k_vals, pk_vals = data[:, 0], data[:, 1]
+    volume = box_size**3
+    pk_vals /= volume
+    pk_interp = interp1d(k_vals, pk_vals, bounds_error=False, fill_value=0)
+
+    kx, ky, kz = local_k_grid(n_grid, box_size, comm, dtype)
+    k_mag = np.sqrt(kx**2 + ky**2 + kz**2)
+
+    # Noise is indexed like the k-grid; draw it in x-slabs and transpose to the k layout
+    random_real = scatter_normal(1, n_grid, comm, dtype)
+    random_imag = scatter_normal(1, n_grid, comm, dtype)
+    noise = transpose_x_to_y(random_real + 1j * random_imag, comm)
+
+    amplitude = np.sqrt(pk_interp(k_mag) / 2.0).astype(dtype, copy=False)
+    field_k = noise * amplitude
+    if comm.Get_rank() == 0:
+        field_k[0, 0, 0] = 0.0  # k = 0 lives on the rank that owns ky = 0
+    field_real = inverse_fft(field_k, comm, norm="forward").real
+
+    mean = global_mean(field_real, comm)
+    variance = global_mean((field_real - mean)**2, comm)
+    if comm.Get_rank() == 0:
+        print("Field variance (real space):", variance)
+        print("Field mean (real space):", mean)
+
+    return field_real
+
+def galaxy_bias_field_mpi(delta, box_size, b1, b2, bG2, n_bar, comm):
+    # Slab version of galaxy_bias_expansion.galaxy_bias_field (Eq. 16), in the precision of delta
+    n_grid = delta.shape[1]
+    is_root = comm.Get_rank() == 0
+
+    delta_k = forward_fft(delta, comm, norm="forward")
+
+    kx, ky, kz = local_k_grid(n_grid, box_size, comm, delta.dtype)
+    k_squared = kx**2 + ky**2 + kz**2
+    if is_root:
+        k_squared[0, 0, 0] = 1  # avoid division by zero
+
+    # Equation (14): Zel'dovich displacement ψ1(q)
+    psi1 = np.stack([inverse_fft(1j * ki / k_squared * delta_k, comm).real for ki in (kx, ky, kz)])
+
+    # Bias operators in Lagrangian space
+    delta_squared = delta**2
+    delta_squared -= global_mean(delta_squared, comm)  # Eq. 8 and 9
+
+    # Tidal operator G2 (Eq. 10); the tensor is symmetric, so off-diagonal terms count twice
+    phi_k = -delta_k / k_squared
+    k_vec = [kx, ky, kz]
+    tidal_squared = np.zeros_like(delta)
+    for i in range(3):
+        for j in range(i, 3):
+            Tij_x = inverse_fft(-(k_vec[i] * k_vec[j] * phi_k), comm).real
+            tidal_squared += (1 if i == j else 2) * Tij_x**2
+    laplacian_phi = inverse_fft(-k_squared * phi_k, comm).real
+    G2 = tidal_squared - laplacian_phi**2
+    G2 -= global_mean(G2, comm)
+
+    # Shift fields from Lagrangian q to Eulerian x using ψ1
+    delta_shifted = displace_field_mpi(delta, psi1, comm)
+    delta2_shifted = displace_field_mpi(delta_squared, psi1, comm)
+    G2_shifted = displace_field_mpi(G2, psi1, comm)
+
+    delta_h = b1 * delta_shifted + b2 * delta2_shifted + bG2 * G2_shifted
+
+    # Shot noise ε(x) ~ N(0, 1/n̄), drawn from the same stream as the serial code
+    if n_bar is not None:
+        voxel_volume = box_size**3 / n_grid**3
+        noise_std = np.sqrt(1 / (n_bar * voxel_volume))
+        delta_h += scatter_normal(noise_std, n_grid, comm, delta.dtype)
+
+    delta_h -= global_mean(delta_h, comm)
+
+    return delta_h
+
+def compute_power_spectrum_mpi(field, box_size, comm):
+    # Slab version of field_power_spectrum.compute_power_spectrum; bin sums and counts are reduced across ranks
+    n_grid = field.shape[1]
+    field_k = forward_fft(field, comm, norm="forward")
+
+    scaling = (2 * np.pi) * (box_size ** 3)
+    power = (np.abs(field_k)**2 * scaling).ravel()
+
+    kx, ky, kz = local_k_grid(n_grid, box_size, comm, field.dtype)
+    k_mag = np.sqrt(kx**2 + ky**2 + kz**2).ravel()
+    k_mag_nonzero = k_mag[k_mag > 0]
+    power_nonzero = power[k_mag > 0]
+
+    k_min = comm.allreduce(k_mag_nonzero.min(), op=MPI.MIN)
+    k_max = np.pi * n_grid / box_size  # Nyquist frequency
+    k_bins = np.logspace(np.log10(k_min), np.log10(k_max), num=7)
+
+    power_sum, bin_edges, _ = binned_statistic(k_mag_nonzero, power_nonzero, bins=k_bins, statistic='sum')
+    counts, _, _ = binned_statistic(k_mag_nonzero, power_nonzero, bins=k_bins, statistic='count')
+    comm.Allreduce(MPI.IN_PLACE, power_sum, op=MPI.SUM)
+    comm.Allreduce(MPI.IN_PLACE, counts, op=MPI.SUM)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        Pk = power_sum / counts
+    k_centers = 0.5 * (bin_edges[:-1] + bin_edges[1:])
+    valid = (Pk > 0) & (~np.isnan(Pk))
+
+    return k_centers[valid], Pk[valid]
+
+def save_slabs(path, field, comm):
+    # Every rank writes its slab into one .npy file, so the full cube is never gathered
+    n_grid = field.shape[1]
+    x0, x1 = slab_range(n_grid, comm)
+    if comm.Get_rank() == 0:
+        out = np.lib.format.open_memmap(path, mode="w+", dtype=field.dtype, shape=(n_grid, n_grid, n_grid))
+        del out
+    comm.Barrier()
+    out = np.load(path, mmap_mode="r+")
+    out[x0:x1] = field
+    out.flush()
+    del out
+    comm.Barrier()
+
+def main():
+    comm = MPI.COMM_WORLD
+    rank = comm.Get_rank()
+
+    usage = "Usage: mpirun -n N python src/mpi_field.py output/[model]/pk [n_grid] [--float32]"
+    args = [arg for arg in sys.argv[1:] if not arg.startswith("--")]
+    flags = [arg for arg in sys.argv[1:] if arg.startswith("--")]
+    unknown = [arg for arg in flags if arg != "--float32"]
+    if not 1 <= len(args) <= 2 or unknown:
+        if rank == 0:
+            if unknown:
+                print(f"Unrecognised argument: {unknown[0]}")
+            print(usage)
+        sys.exit(1)
+
+    dtype = np.float32 if "--float32" in flags else np.float64
+    folder = args[0]
+    if not os.path.isdir(folder):
+        if rank == 0:
+            print(f"Directory not found: {folder}")
+        sys.exit(1)
+
+    if len(args) > 1 and not (args[1].isdigit() and int(args[1]) > 0):
+        if rank == 0:
+            print(f"n_grid must be a positive integer, got: {args[1]}")
+            print(usage)
+        sys.exit(1)
+    n_grid = int(args[1]) if len(args) > 1 else DEFAULT_N_GRID
+    if n_grid % comm.Get_size() != 0:
+        if rank == 0:
+            print(f"n_grid = {n_grid} must be divisible by the number of ranks ({comm.Get_size()})")
+        sys.exit(1)
+
+    box_size = 1000.0
+    b1, b2, bG2 = 1.2, -0.405, -0.127   # as in galaxy_bias_expansion.py
+    n_bar = 1e-3
+
+    parent_folder = os.path.dirname(folder)
+    # Same layout as the serial scripts: a 1024^3 run goes to gaussian_field_n1024 and galaxy_field_n1024
+    gaussian_field_dir = field_dir(parent_folder, "gaussian_field", n_grid)
+    galaxy_field_dir = field_dir(parent_folder, "galaxy_field", n_grid)
+    if rank == 0:
+        os.makedirs(gaussian_field_dir, exist_ok=True)
+        os.makedirs(galaxy_field_dir, exist_ok=True)
+    comm.Barrier()
+
+    for filename in sorted(os.listdir(folder)):
+        if filename.endswith(".txt"):
+            pk_path = os.path.join(folder, filename)
+            base_name = os.path.splitext(filename)[0]
+
+            if rank == 0:
+                print(f"Generating Gaussian field from: {filename} on {comm.Get_size()} ranks")
+            delta = generate_gaussian_field_mpi(pk_path, comm, box_size=box_size, n_grid=n_grid, dtype=dtype)
+            npy_path = os.path.join(gaussian_field_dir, f"{base_name}.npy")
+            save_slabs(npy_path, delta, comm)
+
+            delta_h = galaxy_bias_field_mpi(delta, box_size, b1, b2, bG2, n_bar, comm)
+            galaxy_path = os.path.join(galaxy_field_dir, f"{base_name}_galaxy.npy")
+            save_slabs(galaxy_path, delta_h, comm)
+
+            for label, field in (("Gaussian", delta), ("Galaxy", delta_h)):
+                k_vals, pk_vals = compute_power_spectrum_mpi(field, box_size, comm)
+                if rank == 0:
+                    print(f"{label} field P(k):")
+                    for k, pk in zip(k_vals, pk_vals):
+                        print(f"  k = {k:.5f} h/Mpc   P(k) = {pk:.5e}")
+
+            if rank == 0:
+                print(f"Saved fields to: {npy_path}, {galaxy_path}")
+
+if __name__ == "__main__":
+    main()
@@ -4,6 +4,7 @@ import sys
 import matplotlib.pyplot as plt
 from matplotlib import cm
 from mpl_toolkits.axes_grid1 import make_axes_locatable
+from field_io import load_field
 
 def extract_redshift(filename):
     try:
@@ -32,7 +33,7 @@ def main():
     # Collect and sort all relevant .npy files by redshift
     files_with_z = []
     for filename in os.listdir(input_dir):
-        if filename.endswith(".npy"):
+        if filename.endswith((".npy", ".npz")):
             z = extract_redshift(filename)
             if z is not None:
                 files_with_z.append((z, filename))
@@ -52,7 +53,7 @@ def main():
 
     all_slices = []
     for z, filename in files_with_z:
-        field = np.load(os.path.join(input_dir, filename))
+        field = load_field(os.path.join(input_dir, filename))
         slice_2d = plot_field_slice(field)
         all_slices.append(slice_2d)
 